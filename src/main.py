@@ -1,47 +1,214 @@
 import sys
 import os
 import re
+import shutil
+import hashlib
+import tempfile
+import threading
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QTextEdit, QFileDialog,
+    QApplication, QMainWindow, QPlainTextEdit, QFileDialog,
     QMessageBox, QTabWidget, QToolBar, QInputDialog, QLineEdit
 )
 from PySide6.QtGui import (
     QIcon, QKeySequence, QTextCursor, QTextCharFormat,
-    QColor, QSyntaxHighlighter, QAction
+    QColor, QSyntaxHighlighter, QAction, QTextDocument
 )
-from PySide6.QtCore import Qt, QTimer
+from PySide6.QtCore import Qt, QTimer, QEvent
 import qt_material
 
+# Для подсветки синтаксиса используется RE2 (линейное время, один проход DFA),
+# если он установлен; иначе — стандартный re
+USE_RE2 = True
+highlight_re = re
+if USE_RE2:
+    try:
+        import re2 as highlight_re
+    except ImportError:
+        pass
+
+# Ключевые слова ищутся автоматом Ахо-Корасик за один проход, если есть pyahocorasick
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+LOAD_CHUNK_SIZE = 1 << 20
+
+
+# Палитра подсветки общая для всех вкладок; создаётся при первом обращении,
+# когда QApplication уже существует
+format_lock = threading.Lock()
+highlight_formats = None
+
+
+def get_highlight_formats():
+    global highlight_formats
+    with format_lock:
+        if highlight_formats is None:
+            formats = {}
+            for kind, color in (("keyword", "#ff79c6"), ("string", "#f1fa8c"), ("comment", "#6272a4")):
+                fmt = QTextCharFormat()
+                fmt.setForeground(QColor(color))
+                formats[kind] = fmt
+            highlight_formats = formats
+    return highlight_formats
+
+
+def write_file_atomic(path, data):
+    # Запись во временный файл рядом с целевым и атомарная подмена через os.replace.
+    # Символическая ссылка разыменовывается, чтобы заменялся файл, на который она указывает
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb', buffering=0) as f:
+            view = memoryview(data)
+            while view:
+                view = view[f.write(view):]
+            # Данные сбрасываются на диск до переименования, иначе после сбоя питания файл может оказаться пустым
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+            if hasattr(os, 'chown'):
+                st = os.stat(path)
+                try:
+                    os.chown(tmp_path, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+        else:
+            # mkstemp создаёт файл с правами 0600, новому файлу даются права по umask
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
 
 class SyntaxHighlighter(QSyntaxHighlighter):
+    # Правила компилируются один раз на процесс и переиспользуются всеми документами
+    _rules = None
+
     def __init__(self, document):
         super().__init__(document)
-        self.highlighting_rules = []
-
-        keyword_format = QTextCharFormat()
-        keyword_format.setForeground(QColor("#ff79c6"))
+        self.master_re, self.fmt_by_kind, self.keyword_automaton = self._build_rules()
+        # Пока редактор не отрисован, подсветка не выполняется
+        self.enabled = False
+        self.editor = None
+        # Проходы по видимым строкам объединяются в один за итерацию цикла событий
+        self.visible_timer = QTimer(self)
+        self.visible_timer.setSingleShot(True)
+        self.visible_timer.setInterval(0)
+        self.visible_timer.timeout.connect(self.rehighlight_visible)
+        # Номера уже подсвеченных строк; при добавлении или удалении строк номера сдвигаются,
+        # поэтому набор сбрасывается
+        self.highlighted_blocks = set()
+        document.blockCountChanged.connect(self.reset_highlighted_blocks)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def reset_highlighted_blocks(self, block_count):
+        self.highlighted_blocks.clear()
+
+    def track_viewport(self, editor):
+        # Подсветка включается при первой отрисовке и затем обновляется только для видимых строк
+        self.editor = editor
+        editor.viewport().installEventFilter(self)
+        # updateRequest приходит при прокрутке и при любом изменении содержимого области просмотра,
+        # в том числе когда удаление строк подтягивает снизу ещё не подсвеченные строки
+        editor.updateRequest.connect(lambda rect, dy: self.visible_timer.start())
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and not self.enabled:
+            self.set_enabled(True)
+            self.visible_timer.start()
+        elif event.type() == QEvent.Resize and self.enabled:
+            self.visible_timer.start()
+        return False
+
+    def rehighlight_visible(self):
+        if not self.enabled or self.editor is None:
+            return
+        editor = self.editor
+        bottom = editor.viewport().height()
+        offset = editor.contentOffset()
+        block = editor.firstVisibleBlock()
+        while block.isValid() and editor.blockBoundingGeometry(block).translated(offset).top() <= bottom:
+            if block.blockNumber() not in self.highlighted_blocks:
+                self.rehighlightBlock(block)
+            block = block.next()
+
+    @classmethod
+    def _build_rules(cls):
+        if cls._rules is not None:
+            return cls._rules
+
+        formats = get_highlight_formats()
+        keyword_format = formats["keyword"]
+        string_format = formats["string"]
+        comment_format = formats["comment"]
         keywords = [
             "def", "class", "import", "from", "as", "return", "if", "else", "elif",
             "for", "while", "try", "except", "with", "in", "is", "not", "and", "or"
         ]
-        for word in keywords:
-            pattern = r'\b' + word + r'\b'
-            self.highlighting_rules.append((re.compile(pattern), keyword_format))
 
-        string_format = QTextCharFormat()
-        string_format.setForeground(QColor("#f1fa8c"))
-        self.highlighting_rules.append((re.compile(r'"[^"]*"'), string_format))
-        self.highlighting_rules.append((re.compile(r"'[^']*'"), string_format))
+        # Все правила собраны в одно регулярное выражение с именованными группами,
+        # чтобы каждая строка просматривалась один раз
+        rules = [
+            ("str1", r'"[^"]*"', string_format),
+            ("str2", r"'[^']*'", string_format),
+            ("comment", r'#.*', comment_format),
+        ]
 
-        comment_format = QTextCharFormat()
-        comment_format.setForeground(QColor("#6272a4"))
-        self.highlighting_rules.append((re.compile(r'#.*'), comment_format))
+        keyword_automaton = None
+        if ahocorasick is not None:
+            keyword_automaton = ahocorasick.Automaton()
+            for word in keywords:
+                keyword_automaton.add_word(word, len(word))
+            keyword_automaton.make_automaton()
+        else:
+            # Одна общая альтернатива вместо отдельного выражения на каждое слово
+            pattern = r'\b(?:' + '|'.join(map(highlight_re.escape, keywords)) + r')\b'
+            rules.insert(0, ("kw", pattern, keyword_format))
+
+        master_re = highlight_re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern, _ in rules))
+        fmt_by_kind = {name: fmt for name, _, fmt in rules}
+        fmt_by_kind["kw"] = keyword_format
+
+        cls._rules = (master_re, fmt_by_kind, keyword_automaton)
+        return cls._rules
+
+    def scan_tokens(self, text):
+        # Возвращает участки строки в виде (начало, конец, вид токена)
+        tokens = []
+        if self.keyword_automaton is not None and text:
+            for end, length in self.keyword_automaton.iter(text):
+                start = end - length + 1
+                # Границы слова проверяются после поиска
+                if start > 0 and is_word_char(text[start - 1]):
+                    continue
+                if end + 1 < len(text) and is_word_char(text[end + 1]):
+                    continue
+                tokens.append((start, end + 1, "kw"))
+
+        for match in self.master_re.finditer(text):
+            start, end = match.span()
+            tokens.append((start, end, match.lastgroup))
+        return tokens
 
     def highlightBlock(self, text):
-        for pattern, fmt in self.highlighting_rules:
-            for match in pattern.finditer(text):
-                start, end = match.span()
-                self.setFormat(start, end - start, fmt)
+        if not self.enabled:
+            return
+        self.highlighted_blocks.add(self.currentBlock().blockNumber())
+        for start, end, kind in self.scan_tokens(text):
+            self.setFormat(start, end - start, self.fmt_by_kind[kind])
 
 
 class TextEditor(QMainWindow):
@@ -55,6 +222,7 @@ class TextEditor(QMainWindow):
 
         self.search_term = ""
         self.last_cursor_pos = 0
+        self.dirty_editors = set()
 
         self.init_toolbar()
         self.new_tab()
@@ -113,46 +281,121 @@ class TextEditor(QMainWindow):
         toolbar.addAction(redo_action)
 
     def new_tab(self):
-        editor = QTextEdit()
-        editor.textChanged.connect(self.set_tab_modified)
-        editor.textChanged.connect(self.on_text_changed)  # ← добавлено
+        editor = QPlainTextEdit()
+        self.init_editor(editor)
         index = self.tabs.addTab(editor, "Новый документ")
         self.tabs.setCurrentIndex(index)
 
+    def init_editor(self, editor):
+        editor.file_path = None
+        editor.saved_digest = None
+        editor.highlight_cursors = []
+        editor.loading = False
+
+        # Пачка нажатий клавиш обрабатывается один раз после паузы в наборе
+        editor.debounce_timer = QTimer(editor)
+        editor.debounce_timer.setSingleShot(True)
+        editor.debounce_timer.setInterval(150)
+        editor.debounce_timer.timeout.connect(lambda e=editor: self.recompute(e))
+        editor.textChanged.connect(self.on_text_changed)
+        editor.document().modificationChanged.connect(
+            lambda modified, e=editor: self.on_modification_changed(e, modified)
+        )
+
     def current_editor(self):
         return self.tabs.currentWidget()
 
     def open_file(self):
         filename, _ = QFileDialog.getOpenFileName(self, "Открыть файл", "", "Все файлы (*.*)")
         if filename:
-            with open(filename, 'r', encoding='utf-8') as f:
-                text = f.read()
-            editor = QTextEdit()
-            editor.setPlainText(text)
-            editor.textChanged.connect(self.set_tab_modified)
-            editor.textChanged.connect(self.on_text_changed)  # ← добавлено
-            if filename.endswith((".py", ".md", ".html")):
-                SyntaxHighlighter(editor.document())
+            # Файл открывается и проверяется до создания вкладки
+            f = None
+            try:
+                f = open(filename, 'r', encoding='utf-8', buffering=LOAD_CHUNK_SIZE)
+                chunk = f.read(LOAD_CHUNK_SIZE)
+            except (OSError, UnicodeDecodeError) as error:
+                if f is not None:
+                    f.close()
+                QMessageBox.warning(self, "Открыть файл", f"Не удалось открыть файл:\n{error}")
+                return
+            editor = QPlainTextEdit()
+            self.init_editor(editor)
             index = self.tabs.addTab(editor, os.path.basename(filename))
-            editor.file_path = filename
             self.tabs.setCurrentIndex(index)
+            self.load_file(editor, filename, f, chunk)
+
+    def load_file(self, editor, filename, f, chunk):
+        # Файл читается кусками по 1 МиБ, между кусками управление возвращается в цикл событий
+        document = editor.document()
+        document.blockSignals(True)
+        document.setUndoRedoEnabled(False)
+        editor.setReadOnly(True)
+        editor.loading = True
+        cursor = QTextCursor(document)
+
+        def load_chunk(chunk):
+            done = True
+            loaded = False
+            try:
+                if chunk:
+                    cursor.beginEditBlock()
+                    cursor.insertText(chunk)
+                    cursor.endEditBlock()
+                    next_chunk = f.read(LOAD_CHUNK_SIZE)
+                    QTimer.singleShot(0, lambda: load_chunk(next_chunk))
+                    done = False
+                    return
+                loaded = True
+            except (OSError, UnicodeDecodeError) as error:
+                QMessageBox.warning(self, "Открыть файл", f"Не удалось прочитать файл:\n{error}")
+            finally:
+                if done:
+                    f.close()
+                    document.setUndoRedoEnabled(True)
+                    document.setModified(False)
+                    document.blockSignals(False)
+                    editor.setReadOnly(False)
+                    editor.loading = False
+
+            if not loaded:
+                # Недочитанный файл не оставляется открытым во вкладке
+                self.tabs.removeTab(self.tabs.indexOf(editor))
+                editor.deleteLater()
+                return
+
+            # Курсор редактора сдвигался вместе со вставками, возвращаем его в начало, как после setPlainText
+            editor.moveCursor(QTextCursor.Start)
+            editor.file_path = filename
+            if filename.endswith((".py", ".md", ".html")):
+                SyntaxHighlighter(document).track_viewport(editor)
+
+        QTimer.singleShot(0, lambda: load_chunk(chunk))
 
     def save_file(self):
         editor = self.current_editor()
-        if editor:
-            path = getattr(editor, 'file_path', None)
+        # Пока файл загружается, сохранять, искать и заменять нельзя
+        if editor and not editor.loading:
+            path = editor.file_path
             if not path:
                 path, _ = QFileDialog.getSaveFileName(self, "Сохранить файл", "", "Текстовые файлы (*.txt)")
             if path:
-                with open(path, 'w', encoding='utf-8') as f:
-                    f.write(editor.toPlainText())
+                self.write_editor(editor, path)
                 editor.file_path = path
                 self.tabs.setTabText(self.tabs.currentIndex(), os.path.basename(path))
                 editor.document().setModified(False)
 
+    def write_editor(self, editor, path):
+        data = editor.toPlainText().encode('utf-8')
+        # Если содержимое не изменилось с последнего сохранения, файл не перезаписывается
+        saved = (path, hashlib.sha1(data).digest())
+        if editor.saved_digest == saved:
+            return
+        write_file_atomic(path, data)
+        editor.saved_digest = saved
+
     def find_text(self):
         editor = self.current_editor()
-        if editor:
+        if editor and not editor.loading:
             find_str, ok = QInputDialog.getText(self, "Поиск", "Что найти:")
             if ok and find_str:
                 self.search_term = find_str
@@ -176,14 +419,20 @@ class TextEditor(QMainWindow):
 
     def replace_text(self):
         editor = self.current_editor()
-        if editor:
+        if editor and not editor.loading:
             find_str, ok1 = QInputDialog.getText(self, "Заменить", "Что найти:")
             if ok1 and find_str:
                 replace_str, ok2 = QInputDialog.getText(self, "Заменить на", "Заменить на что:")
                 if ok2:
-                    text = editor.toPlainText()
-                    new_text = text.replace(find_str, replace_str)
-                    editor.setPlainText(new_text)
+                    # Замена выполняется внутри документа, история отмены сохраняется
+                    document = editor.document()
+                    cursor = QTextCursor(document)
+                    cursor.beginEditBlock()
+                    found = document.find(find_str, cursor, QTextDocument.FindCaseSensitively)
+                    while not found.isNull():
+                        found.insertText(replace_str)
+                        found = document.find(find_str, found, QTextDocument.FindCaseSensitively)
+                    cursor.endEditBlock()
 
     def highlight_all(self, editor, text):
         cursor = editor.textCursor()
@@ -192,21 +441,21 @@ class TextEditor(QMainWindow):
         fmt = QTextCharFormat()
         fmt.setBackground(QColor("#ffeb3b"))
 
-        regex = re.compile(re.escape(text), re.IGNORECASE)
-        document_text = editor.toPlainText()
-
+        document = editor.document()
         first_found_cursor = None
+        editor.highlight_cursors = []
 
-        for match in regex.finditer(document_text):
-            start, end = match.span()
-
-            temp_cursor = editor.textCursor()
-            temp_cursor.setPosition(start)
-            temp_cursor.setPosition(end, QTextCursor.KeepAnchor)
-            temp_cursor.mergeCharFormat(fmt)
+        # Поиск выполняется средствами Qt, без копии текста документа
+        found = document.find(text, QTextCursor(document))
+        while not found.isNull():
+            found.mergeCharFormat(fmt)
+            # Курсоры Qt сдвигаются вместе с правками документа
+            editor.highlight_cursors.append(found)
 
             if first_found_cursor is None:
-                first_found_cursor = temp_cursor
+                first_found_cursor = found
+
+            found = document.find(text, found)
 
         cursor.endEditBlock()
 
@@ -216,17 +465,23 @@ class TextEditor(QMainWindow):
             QMessageBox.information(self, "Поиск", "Текст не найден.")
 
     def clear_highlight(self, editor):
+        # Сбрасываются только подсвеченные ранее участки, а не весь документ
+        cursors = editor.highlight_cursors
+        if not cursors:
+            return
+
         cursor = editor.textCursor()
         cursor.beginEditBlock()
 
         fmt = QTextCharFormat()
         fmt.setBackground(QColor(Qt.transparent))
 
-        cursor.movePosition(QTextCursor.Start)
-        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
-        cursor.mergeCharFormat(fmt)
+        for found in cursors:
+            if found.hasSelection():
+                found.mergeCharFormat(fmt)
 
         cursor.endEditBlock()
+        cursors.clear()
 
     def undo_text(self):
         editor = self.current_editor()
@@ -238,32 +493,43 @@ class TextEditor(QMainWindow):
         if editor:
             editor.redo()
 
-    def set_tab_modified(self):
-        editor = self.current_editor()
-        if editor and editor.document().isModified():
-            current_text = self.tabs.tabText(self.tabs.currentIndex())
+    def set_tab_modified(self, editor):
+        index = self.tabs.indexOf(editor)
+        if index != -1 and editor.document().isModified():
+            current_text = self.tabs.tabText(index)
             if not current_text.endswith('*'):
-                self.tabs.setTabText(self.tabs.currentIndex(), current_text + '*')
+                self.tabs.setTabText(index, current_text + '*')
 
     def on_text_changed(self):
-        editor = self.current_editor()
+        editor = self.sender()
         if editor:
             # Мы не очищаем подсветку каждый раз, только при действии поиска
-            pass
+            editor.debounce_timer.start()
+
+    def recompute(self, editor):
+        self.set_tab_modified(editor)
+
+    def on_modification_changed(self, editor, modified):
+        if modified:
+            self.dirty_editors.add(editor)
+        else:
+            self.dirty_editors.discard(editor)
 
     def auto_save(self):
-        for i in range(self.tabs.count()):
-            editor = self.tabs.widget(i)
-            if hasattr(editor, 'file_path') and editor.document().isModified():
-                with open(editor.file_path, 'w', encoding='utf-8') as f:
-                    f.write(editor.toPlainText())
+        # Обходятся только изменённые вкладки
+        for editor in list(self.dirty_editors):
+            i = self.tabs.indexOf(editor)
+            path = editor.file_path
+            if i != -1 and path:
+                self.write_editor(editor, path)
                 editor.document().setModified(False)
-                if self.tabs.tabText(i).endswith('*'):
-                    self.tabs.setTabText(i, self.tabs.tabText(i)[:-1])
+                text = self.tabs.tabText(i)
+                if text.endswith('*'):
+                    self.tabs.setTabText(i, text[:-1])
 
     def closeEvent(self, event):
-        unsaved = any(self.tabs.widget(i).document().isModified() for i in range(self.tabs.count()))
-        if unsaved:
+        # Набор изменённых вкладок поддерживается сигналом modificationChanged
+        if self.dirty_editors:
             reply = QMessageBox.question(self, "Выход", "Есть несохранённые изменения. Сохранить перед выходом?",
                                          QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
             if reply == QMessageBox.Save: